@@ -0,0 +1,567 @@
+"""
+Local stand-in for anaconda.org and the OCI mirror (ghcr.io/channel-mirrors),
+to exercise and benchmark `update-from-repodata` without the live network.
+
+Fixtures live in a directory whose layout mirrors the URL paths being served:
+
+    conda-forge/<subdir>/repodata_from_packages.json.bz2
+    conda-forge/<subdir>/<artifact>.conda|.tar.bz2
+    conda-forge/label/<label>/<subdir>/repodata.json.bz2
+    v2/channel-mirrors/conda-forge/<subdir>/<name>/manifests/<tag>
+    v2/channel-mirrors/conda-forge/<subdir>/<name>/blobs/sha256:<digest>
+
+Paths under /web/ serve the same files without HTTP range support, like
+conda-web.anaconda.org does. Missing repodata files are served empty, like
+anaconda.org does for subdirs without packages.
+
+Subcommands:
+
+- generate: write synthetic fixtures
+- serve: serve fixtures, optionally recording misses from the real upstreams
+- benchmark: run update_from_repodata against an in-process server and report
+  artifacts/sec and DB write throughput
+"""
+
+import argparse
+import bz2
+import gzip
+import hashlib
+import io
+import json
+import os
+import random
+import shutil
+import sqlite3
+import sys
+import tarfile
+import tempfile
+import threading
+import time
+import zipfile
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from urllib.error import HTTPError
+from urllib.parse import unquote
+from urllib.request import Request, urlopen
+
+import path_to_artifacts_db
+
+UPSTREAMS = {
+    "/web/conda-forge/": "https://conda-web.anaconda.org/conda-forge/",
+    "/conda-forge/": "https://conda.anaconda.org/conda-forge/",
+    "/v2/": "https://ghcr.io/v2/",
+}
+REPODATA_FILENAMES = ("repodata_from_packages.json.bz2", "repodata.json.bz2")
+OCI_MANIFEST_MEDIA_TYPE = "application/vnd.oci.image.manifest.v1+json"
+OCI_INFO_MEDIA_TYPE = "application/vnd.conda.info.v1.tar+gzip"
+FORWARDED_HEADERS = ("Accept", "Authorization")
+
+
+class FaultInjection:
+    """
+    Latency, random 5xx errors and 429 throttling applied to every request.
+    Also keeps counters so the benchmark can report what the client went through.
+    """
+
+    def __init__(self, latency=0.0, jitter=0.0, error_rate=0.0, max_rps=0):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.max_rps = max_rps
+        self.requests = self.errors = self.throttled = self.bytes_sent = 0
+        self._recent = deque()
+        self._lock = threading.Lock()
+
+    def before_request(self):
+        """Returns an HTTP status to fail the request with, or None."""
+        with self._lock:
+            self.requests += 1
+            if self.max_rps:
+                now = time.monotonic()
+                while self._recent and now - self._recent[0] > 1:
+                    self._recent.popleft()
+                if len(self._recent) >= self.max_rps:
+                    self.throttled += 1
+                    return 429
+                self._recent.append(now)
+            if self.error_rate and random.random() < self.error_rate:
+                self.errors += 1
+                return 503
+        delay = self.latency + random.uniform(0, self.jitter)
+        if delay > 0:
+            time.sleep(delay)
+        return None
+
+    def sent(self, n_bytes):
+        with self._lock:
+            self.bytes_sent += n_bytes
+
+    def stats(self):
+        return {
+            "requests": self.requests,
+            "errors": self.errors,
+            "throttled": self.throttled,
+            "bytes_sent": self.bytes_sent,
+        }
+
+
+def empty_repodata(subdir):
+    return bz2.compress(
+        json.dumps(
+            {
+                "info": {"subdir": subdir},
+                "packages": {},
+                "packages.conda": {},
+                "removed": [],
+            }
+        ).encode()
+    )
+
+
+def parse_range(header, size):
+    """Parse a single `bytes=` range into (start, end) inclusive, or None."""
+    if not header or not header.startswith("bytes=") or "," in header:
+        return None
+    start, _, end = header[len("bytes=") :].partition("-")
+    if not start:
+        start, end = max(size - int(end), 0), size - 1
+    else:
+        start, end = int(start), min(int(end), size - 1) if end else size - 1
+    return start, end
+
+
+class StandInHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    # Set by make_server()
+    fixtures: Path
+    faults: FaultInjection
+    record = False
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_HEAD(self):
+        self.handle_request(head=True)
+
+    def do_GET(self):
+        self.handle_request(head=False)
+
+    def handle_request(self, head):
+        status = self.faults.before_request()
+        if status is not None:
+            headers = {"Retry-After": "1"} if status == 429 else {}
+            return self.respond(status, b"", headers=headers, head=head)
+
+        url_path = unquote(self.path.split("?", 1)[0])
+        supports_range = not url_path.startswith("/web/")
+        relative = url_path.removeprefix("/web/" if not supports_range else "/")
+        fixture = (self.fixtures / relative).resolve()
+        if not fixture.is_relative_to(self.fixtures.resolve()):
+            return self.respond(403, b"", head=head)
+
+        if not fixture.is_file() and self.record:
+            status, headers = self.record_fixture(url_path, fixture)
+            if status != 200:
+                return self.respond(status, b"", headers=headers, head=head)
+
+        if fixture.is_file():
+            body = fixture.read_bytes()
+        elif fixture.name in REPODATA_FILENAMES:
+            body = empty_repodata(fixture.parent.name)
+        else:
+            return self.respond(404, b"", head=head)
+
+        headers = {"Content-Type": self.content_type(fixture, body)}
+        if supports_range:
+            headers["Accept-Ranges"] = "bytes"
+            byte_range = parse_range(self.headers.get("Range"), len(body))
+            if byte_range is not None:
+                start, end = byte_range
+                if start >= len(body):
+                    headers["Content-Range"] = f"bytes */{len(body)}"
+                    return self.respond(416, b"", headers=headers, head=head)
+                headers["Content-Range"] = f"bytes {start}-{end}/{len(body)}"
+                return self.respond(
+                    206, body[start : end + 1], headers=headers, head=head
+                )
+        return self.respond(200, body, headers=headers, head=head)
+
+    def record_fixture(self, url_path, fixture):
+        for prefix, upstream in UPSTREAMS.items():
+            if url_path.startswith(prefix):
+                url = upstream + url_path[len(prefix) :]
+                break
+        else:
+            return 404, {}
+        headers = {
+            name: self.headers[name]
+            for name in FORWARDED_HEADERS
+            if name in self.headers
+        }
+        try:
+            with urlopen(Request(url, headers=headers)) as response:
+                body = response.read()
+        except HTTPError as exc:
+            # e.g. the registry asking for a token; the client deals with it
+            passthrough = {"WWW-Authenticate", "Retry-After"}
+            return exc.code, {k: v for k, v in exc.headers.items() if k in passthrough}
+        fixture.parent.mkdir(parents=True, exist_ok=True)
+        fixture.write_bytes(body)
+        return 200, {}
+
+    def content_type(self, fixture, body):
+        if fixture.parent.name == "manifests":
+            return json.loads(body).get("mediaType", OCI_MANIFEST_MEDIA_TYPE)
+        return "application/octet-stream"
+
+    def respond(self, status, body, headers=None, head=False):
+        self.send_response(status)
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        if not head:
+            self.wfile.write(body)
+            self.faults.sent(len(body))
+
+
+def make_server(fixtures, host="127.0.0.1", port=0, record=False, **faults):
+    handler = type(
+        "StandInHandler",
+        (StandInHandler,),
+        {
+            "fixtures": Path(fixtures),
+            "faults": FaultInjection(**faults),
+            "record": record,
+        },
+    )
+    return ThreadingHTTPServer((host, port), handler)
+
+
+def configure_endpoints(base_url, labels):
+    """Point path_to_artifacts_db to a stand-in listening at `base_url`."""
+    path_to_artifacts_db.CHANNEL_URL = f"{base_url}/conda-forge"
+    path_to_artifacts_db.CHANNEL_WEB_URL = f"{base_url}/web/conda-forge"
+    path_to_artifacts_db.OCI_REGISTRY = f"{base_url}/channel-mirrors"
+    path_to_artifacts_db.LABELS = ",".join(labels)
+
+
+def fixture_labels(fixtures):
+    label_dir = Path(fixtures, "conda-forge", "label")
+    labels = sorted(p.name for p in label_dir.iterdir()) if label_dir.is_dir() else []
+    return ["main", *labels]
+
+
+def tar_bytes(members, mode="w"):
+    buffer = io.BytesIO()
+    with tarfile.open(fileobj=buffer, mode=mode) as tar:
+        for name, content in members.items():
+            info = tarfile.TarInfo(name)
+            info.size = len(content)
+            tar.addfile(info, io.BytesIO(content))
+    return buffer.getvalue()
+
+
+def write_conda(path, stem, info_members):
+    import zstandard
+
+    compressor = zstandard.ZstdCompressor()
+    with zipfile.ZipFile(path, "w", compression=zipfile.ZIP_STORED) as zf:
+        zf.writestr("metadata.json", json.dumps({"conda_pkg_format_version": 2}))
+        zf.writestr(f"pkg-{stem}.tar.zst", compressor.compress(tar_bytes({})))
+        zf.writestr(
+            f"info-{stem}.tar.zst", compressor.compress(tar_bytes(info_members))
+        )
+
+
+def write_oci_info(fixtures, subdir, name, version, build, info_members):
+    repo = Path(fixtures, "v2", "channel-mirrors", "conda-forge", subdir)
+    repo /= f"zzz{name}" if name.startswith("_") else name
+    blob = gzip.compress(tar_bytes(info_members), mtime=0)
+    config = b"{}"
+    for content in (blob, config):
+        digest = hashlib.sha256(content).hexdigest()
+        (repo / "blobs").mkdir(parents=True, exist_ok=True)
+        (repo / "blobs" / f"sha256:{digest}").write_bytes(content)
+    title = f"{name}-{version}-{build}.info.tar.gz"
+    manifest = {
+        "schemaVersion": 2,
+        "mediaType": OCI_MANIFEST_MEDIA_TYPE,
+        "config": {
+            "mediaType": "application/vnd.unknown.config.v1+json",
+            "size": len(config),
+            "digest": f"sha256:{hashlib.sha256(config).hexdigest()}",
+        },
+        "layers": [
+            {
+                "mediaType": OCI_INFO_MEDIA_TYPE,
+                "size": len(blob),
+                "digest": f"sha256:{hashlib.sha256(blob).hexdigest()}",
+                "annotations": {"org.opencontainers.image.title": title},
+            }
+        ],
+    }
+    tag = f"{version}-{build}".replace("+", "__p__").replace("!", "__e__")
+    (repo / "manifests").mkdir(parents=True, exist_ok=True)
+    (repo / "manifests" / tag).write_text(json.dumps(manifest))
+
+
+def generate_fixtures(
+    fixtures,
+    packages=200,
+    files_per_package=100,
+    subdirs=("linux-64", "noarch"),
+    labels=("dev",),
+    seed=0,
+):
+    """
+    Write `packages` synthetic artifacts per channel label and subdir. Artifacts
+    alternate between .conda (streamed) and .tar.bz2 (OCI on main, tar download on
+    labels), and share some paths so that posting lists get appended to.
+    """
+    rng = random.Random(seed)
+    timestamp = int(time.time() * 1000)
+    for label, subdir in (
+        (label, subdir) for label in ("main", *labels) for subdir in subdirs
+    ):
+        if label == "main":
+            channel_dir = Path(fixtures, "conda-forge", subdir)
+            repodata_name = "repodata_from_packages.json.bz2"
+        else:
+            channel_dir = Path(fixtures, "conda-forge", "label", label, subdir)
+            repodata_name = "repodata.json.bz2"
+        channel_dir.mkdir(parents=True, exist_ok=True)
+        repodata = {"info": {"subdir": subdir}, "packages": {}, "packages.conda": {}}
+        for i in range(packages):
+            name, version = f"pkg{i % (packages // 4 or 1)}", f"1.{i}"
+            build = f"h{rng.getrandbits(32):08x}_{label}"
+            stem = f"{name}-{version}-{build}"
+            paths = [f"lib/{name}/file{n}.py" for n in range(files_per_package)]
+            paths += ["lib/libshared.so", f"bin/{name}"]
+            index = {
+                "name": name,
+                "version": version,
+                "build": build,
+                "subdir": subdir,
+                "timestamp": timestamp + i,
+            }
+            info_members = {
+                "info/index.json": json.dumps(index).encode(),
+                "info/paths.json": json.dumps(
+                    {"paths": [{"_path": path} for path in paths], "paths_version": 1}
+                ).encode(),
+            }
+            if i % 2:
+                write_conda(channel_dir / f"{stem}.conda", stem, info_members)
+                repodata["packages.conda"][f"{stem}.conda"] = index
+            else:
+                (channel_dir / f"{stem}.tar.bz2").write_bytes(
+                    tar_bytes(info_members, mode="w:bz2")
+                )
+                repodata["packages"][f"{stem}.tar.bz2"] = index
+                if label == "main":
+                    write_oci_info(fixtures, subdir, name, version, build, info_members)
+        (channel_dir / repodata_name).write_bytes(
+            bz2.compress(json.dumps(repodata).encode())
+        )
+
+
+class TimedConnection(sqlite3.Connection):
+    """sqlite3 connection that accumulates the time spent writing."""
+
+    write_seconds = 0.0
+
+    def execute(self, *args, **kwargs):
+        t0 = time.perf_counter()
+        try:
+            return super().execute(*args, **kwargs)
+        finally:
+            self.write_seconds += time.perf_counter() - t0
+
+    def executemany(self, *args, **kwargs):
+        t0 = time.perf_counter()
+        try:
+            return super().executemany(*args, **kwargs)
+        finally:
+            self.write_seconds += time.perf_counter() - t0
+
+    def commit(self):
+        t0 = time.perf_counter()
+        try:
+            return super().commit()
+        finally:
+            self.write_seconds += time.perf_counter() - t0
+
+
+def benchmark_update(fixtures, workdir=None, **faults):
+    """
+    Run update_from_repodata on an empty database against an in-process stand-in.
+    Returns a dict with throughput numbers and the server counters.
+    """
+    from conda_oci_mirror import defaults as oci_defaults
+
+    fixtures = Path(fixtures).resolve()
+    server = make_server(fixtures, **faults)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    host, port = server.server_address
+    configure_endpoints(f"http://{host}:{port}", fixture_labels(fixtures))
+
+    cwd = os.getcwd()
+    workdir = Path(workdir or tempfile.mkdtemp(prefix="offline-channel-"))
+    workdir.mkdir(parents=True, exist_ok=True)
+    os.chdir(workdir)
+    # get_oci_artifact_data can't take a cache_dir, and by default the info blobs
+    # are cached inside the installed conda_oci_mirror package
+    oci_cache_dir = oci_defaults.CACHE_DIR
+    oci_defaults.CACHE_DIR = workdir / ".oci_cache"
+    try:
+        # Start from scratch so every run does the same work
+        for leftover in (
+            ".repodata_cache",
+            ".oci_cache",
+            "failed_artifacts.txt",
+            "path_to_artifacts.db",
+        ):
+            if os.path.isdir(leftover):
+                shutil.rmtree(leftover)
+            elif os.path.exists(leftover):
+                os.unlink(leftover)
+        path_to_artifacts_db.connect(
+            bootstrap=True, dbpath="path_to_artifacts.db"
+        ).close()
+        db = sqlite3.connect("path_to_artifacts.db", factory=TimedConnection)
+        t0 = time.perf_counter()
+        path_to_artifacts_db.update_from_repodata(db)
+        elapsed = time.perf_counter() - t0
+        artifacts = path_to_artifacts_db.count_artifacts(db)
+        (paths,) = db.execute("SELECT COUNT(*) FROM PathToArtifactIds").fetchone()
+        results = {
+            "seconds": elapsed,
+            "artifacts": artifacts,
+            "artifacts_per_second": artifacts / elapsed,
+            "paths": paths,
+            "db_write_seconds": db.write_seconds,
+            "db_rows_written": db.total_changes,
+            "db_rows_per_second": db.total_changes / (db.write_seconds or float("nan")),
+            "failed": len(Path("failed_artifacts.txt").read_text().splitlines())
+            if Path("failed_artifacts.txt").is_file()
+            else 0,
+            "server": server.RequestHandlerClass.faults.stats(),
+        }
+        db.close()
+    finally:
+        oci_defaults.CACHE_DIR = oci_cache_dir
+        os.chdir(cwd)
+        server.shutdown()
+        server.server_close()
+    return results
+
+
+def add_fault_arguments(parser):
+    parser.add_argument(
+        "--latency", type=float, default=0.0, help="seconds per request"
+    )
+    parser.add_argument(
+        "--jitter", type=float, default=0.0, help="extra random seconds"
+    )
+    parser.add_argument(
+        "--error-rate",
+        type=float,
+        default=0.0,
+        help="fraction of requests failing with 503",
+    )
+    parser.add_argument(
+        "--max-rps", type=int, default=0, help="answer 429 above this many requests/sec"
+    )
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    subparsers = parser.add_subparsers(
+        dest="command", required=True, metavar="subcommand"
+    )
+
+    sub = subparsers.add_parser("generate", help="write synthetic fixtures")
+    sub.add_argument("fixtures")
+    sub.add_argument("--packages", type=int, default=200, help="per label and subdir")
+    sub.add_argument("--files-per-package", type=int, default=100)
+    sub.add_argument("--labels", default="dev", help="comma-separated extra labels")
+
+    sub = subparsers.add_parser("serve", help="serve fixtures over HTTP")
+    sub.add_argument("fixtures")
+    sub.add_argument("--host", default="127.0.0.1")
+    sub.add_argument("--port", type=int, default=8080)
+    sub.add_argument(
+        "--record",
+        action="store_true",
+        help="fetch and store missing files from upstream",
+    )
+    add_fault_arguments(sub)
+
+    sub = subparsers.add_parser("benchmark", help="benchmark update-from-repodata")
+    sub.add_argument("fixtures")
+    sub.add_argument(
+        "--workdir", help="where to write the database (default: temporary)"
+    )
+    sub.add_argument("--json", action="store_true", help="print results as JSON")
+    add_fault_arguments(sub)
+
+    args = parser.parse_args(argv)
+    faults = {
+        "latency": getattr(args, "latency", 0.0),
+        "jitter": getattr(args, "jitter", 0.0),
+        "error_rate": getattr(args, "error_rate", 0.0),
+        "max_rps": getattr(args, "max_rps", 0),
+    }
+
+    if args.command == "generate":
+        generate_fixtures(
+            args.fixtures,
+            packages=args.packages,
+            files_per_package=args.files_per_package,
+            labels=tuple(label for label in args.labels.split(",") if label),
+        )
+    elif args.command == "serve":
+        server = make_server(
+            args.fixtures, host=args.host, port=args.port, record=args.record, **faults
+        )
+        base_url = f"http://{args.host}:{server.server_address[1]}"
+        print(
+            "Serving on",
+            base_url,
+            "; point updates to it with:",
+            f"  CONDA_FORGE_PATHS_CHANNEL_URL={base_url}/conda-forge",
+            f"  CONDA_FORGE_PATHS_CHANNEL_WEB_URL={base_url}/web/conda-forge",
+            f"  CONDA_FORGE_PATHS_OCI_REGISTRY={base_url}/channel-mirrors",
+            f"  CONDA_FORGE_PATHS_LABELS={','.join(fixture_labels(args.fixtures))}",
+            sep="\n",
+        )
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            print(server.RequestHandlerClass.faults.stats())
+            server.server_close()
+    elif args.command == "benchmark":
+        results = benchmark_update(args.fixtures, workdir=args.workdir, **faults)
+        if args.json:
+            print(json.dumps(results))
+            return
+        print(
+            f"Added {results['artifacts']} artifacts and {results['paths']} paths "
+            f"in {results['seconds']:.2f} seconds ({results['failed']} failed)",
+            f"Artifacts/sec: {results['artifacts_per_second']:.1f}",
+            f"DB writes: {results['db_rows_written']} rows in "
+            f"{results['db_write_seconds']:.3f} seconds "
+            f"({results['db_rows_per_second']:.0f} rows/sec)",
+            f"Server: {results['server']}",
+            sep="\n",
+        )
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,40 +1,58 @@
-import bz2
+"""
+Build, maintain and query the conda-forge path-to-artifacts database.
+
+Query and maintenance subcommands only need the standard library. The network
+and packaging dependencies (conda-forge-metadata, tqdm) are imported lazily by
+the functions that update the database from repodata.
+"""
+
+import argparse
 import json
 import logging
 import os
+import re
 import sqlite3
+import struct
 import sys
 import time
-from concurrent.futures import ThreadPoolExecutor, as_completed
+from bisect import bisect_right
 from datetime import datetime, UTC
-from itertools import batched, chain, product
+from functools import lru_cache
+from itertools import batched, chain
 from pathlib import Path
-from urllib.error import HTTPError
-from urllib.request import urlretrieve
-
-from conda_forge_metadata.artifact_info import get_artifact_info_as_json
-from conda_forge_metadata.artifact_info.info_json import info_json_from_tar_generator
-from conda_forge_metadata.repodata import SUBDIRS, all_labels
-from conda_forge_metadata.streaming import get_streamed_artifact_data
 
-try:
-    from tqdm.auto import tqdm
-except ImportError:
 
-    def tqdm(iterator, *args, **kwargs):
+def tqdm(iterator, *args, **kwargs):
+    try:
+        from tqdm.auto import tqdm as tqdm_auto
+    except ImportError:
         desc = kwargs.pop("desc", "")
         if desc:
             print(desc)
         return iterator
+    return tqdm_auto(iterator, *args, **kwargs)
 
 
 DBPATH = "path_to_artifacts.db"
+# Remote endpoints; override them to point updates to a local stand-in
+# (see offline_channel.py)
+CHANNEL_URL = os.environ.get(
+    "CONDA_FORGE_PATHS_CHANNEL_URL", "https://conda.anaconda.org/conda-forge"
+)
+CHANNEL_WEB_URL = os.environ.get(
+    "CONDA_FORGE_PATHS_CHANNEL_WEB_URL", "https://conda-web.anaconda.org/conda-forge"
+)
+OCI_REGISTRY = os.environ.get(
+    "CONDA_FORGE_PATHS_OCI_REGISTRY", "ghcr.io/channel-mirrors"
+)
+# Comma-separated; all conda-forge labels are used if unset
+LABELS = os.environ.get("CONDA_FORGE_PATHS_LABELS", "")
 log = logging.getLogger(__name__)
 
 
-def connect(bootstrap=False):
+def connect(bootstrap=False, dbpath=DBPATH):
     kwargs = {"isolation_level": None} if bootstrap else {}
-    db = sqlite3.connect(DBPATH, **kwargs)
+    db = sqlite3.connect(dbpath, **kwargs)
     if bootstrap:
         db.executescript(
             """
@@ -62,6 +80,18 @@ def connect(bootstrap=False):
     return db
 
 
+def connect_readonly(dbpath=DBPATH):
+    """
+    Open an existing database read-only. Unlike `connect`, a missing file is an
+    error instead of a new empty database.
+    """
+    from urllib.parse import quote
+
+    if not os.path.isfile(dbpath):
+        raise FileNotFoundError(f"No such database: {dbpath}")
+    return sqlite3.connect(f"file:{quote(os.path.abspath(dbpath))}?mode=ro", uri=True)
+
+
 def bootstrap_from_libcfgraph_path_to_artifact(db, artifacts_dir):
     def iterator():
         for batch in tqdm(
@@ -129,22 +159,219 @@ def bootstrap_from_libcfgraph_path_to_artifact(db, artifacts_dir):
             db.execute("BEGIN")
 
 
-def index_full_text_search(db):
+FTS_TOKENIZERS = {
+    "unicode61": (
+        "unicode61 tokenchars '_-.()[]?!+ 0123456789abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ' "
+        "separators '/.' remove_diacritics 1"
+    ),
+    "trigram": "trigram",
+}
+# Candidate FTS configurations compared by `fts-report`
+FTS_VARIANTS = {
+    "default": {},
+    "detail-column": {"detail": "column"},
+    "detail-none": {"detail": "none"},
+    "detail-none-nocolsize": {"detail": "none", "columnsize": False},
+    "prefix-2-3": {"prefix": (2, 3)},
+    "trigram": {"tokenizer": "trigram"},
+    "trigram-detail-none": {"tokenizer": "trigram", "detail": "none"},
+}
+# find_files inputs used to benchmark the FTS configurations. A trailing * marks
+# a typeahead prefix query. Each variant runs the MATCH expression it supports for
+# them (see fts_match_expression), so all variants serve the same workload
+FTS_BENCHMARK_QUERIES = (
+    "python",
+    "numpy",
+    "site-packages",
+    "__init__.py",
+    "libssl.so.3",
+    "libstdc++.so.6",
+    "cmake",
+    "LICENSE",
+    "bin/python",
+    "include/zlib.h",
+    "site-packages/numpy",
+    "pyt*",
+    "libz*",
+)
+# Characters the unicode61 tokenizer above splits on: anything that is not a
+# token character, plus the explicit separators. Whitespace is split too, like
+# datasette's escape_fts() does
+FTS_UNICODE61_SEPARATORS = re.compile(r"[^\w\-()\[\]?!+]+")
+
+
+def fts_schema(
+    table="PathToArtifactIds_fts",
+    detail="full",
+    columnsize=True,
+    prefix=(),
+    tokenizer="unicode61",
+):
+    if detail not in ("full", "column", "none"):
+        raise ValueError(f"Unknown FTS5 detail option: {detail}")
+    options = [
+        "path",
+        f'tokenize="{FTS_TOKENIZERS[tokenizer]}"',
+        "content=PathToArtifactIds",
+        f"detail={detail}",
+    ]
+    if not columnsize:
+        options.append("columnsize=0")
+    if prefix:
+        options.append("prefix='{}'".format(" ".join(map(str, prefix))))
+    return "CREATE VIRTUAL TABLE {} USING fts5({})".format(table, ", ".join(options))
+
+
+def index_full_text_search(db, table="PathToArtifactIds_fts", **options):
+    """
+    (Re)create the FTS index for PathToArtifactIds. See `fts_schema` for the options.
+
+    The index is dropped first if its schema does not match the requested options,
+    so switching configurations does not need manual cleanup.
+    """
+    schema = fts_schema(table, **options)
+    for (current,) in db.execute(
+        "SELECT sql FROM sqlite_master WHERE type = 'table' AND name = (?)", (table,)
+    ):
+        if current != schema:
+            db.execute(f"DROP TABLE {table}")
     db.executescript(
-        """
-        CREATE VIRTUAL TABLE IF NOT EXISTS PathToArtifactIds_fts 
-        USING fts5(
-            path,
-            tokenize="unicode61 tokenchars '_-.()[]?!+ 0123456789abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ' separators '/.' remove_diacritics 1",
-            content=PathToArtifactIds
-        );
-        INSERT INTO PathToArtifactIds_fts(PathToArtifactIds_fts) VALUES('rebuild');
+        f"""
+        {schema.replace("CREATE VIRTUAL TABLE", "CREATE VIRTUAL TABLE IF NOT EXISTS")};
+        INSERT INTO {table}({table}) VALUES('rebuild');
         """
     )
     db.commit()
 
 
-def query(db, q, limit=100, fts=False):
+def fts_options(db, table="PathToArtifactIds_fts"):
+    """
+    Return the detail and tokenizer options of an existing FTS index, as taken by
+    `fts_schema`. Indexes created before those options existed are full/unicode61.
+    """
+    for (sql,) in db.execute(
+        "SELECT sql FROM sqlite_master WHERE type = 'table' AND name = (?)", (table,)
+    ):
+        detail = next((d for d in ("column", "none") if f"detail={d}" in sql), "full")
+        tokenizer = "trigram" if 'tokenize="trigram"' in sql else "unicode61"
+        return detail, tokenizer
+    return "full", "unicode61"
+
+
+def fts_match_expression(q, detail="full", tokenizer="unicode61", prefix=False):
+    """
+    Build the MATCH expression for a find_files input.
+
+    With detail=full the input is matched as a phrase. The other detail modes
+    reject phrase queries, so the input is split into the tokens the index stores
+    (path components or trigrams) and all of them must match, in any order.
+    """
+    if detail == "full":
+        tokens = [q]
+    elif tokenizer == "trigram":
+        tokens = [q[i : i + 3] for i in range(len(q) - 2)] or [q]
+    else:
+        tokens = [token for token in FTS_UNICODE61_SEPARATORS.split(q) if token]
+    expression = " ".join(
+        '"{}"'.format(token.replace('"', '""')) for token in dict.fromkeys(tokens)
+    )
+    # Trigram indexes match substrings, so prefixes need no special syntax
+    if prefix and tokenizer != "trigram":
+        expression += "*"
+    return expression
+
+
+def used_bytes(db):
+    page_size = db.execute("PRAGMA page_size").fetchone()[0]
+    page_count = db.execute("PRAGMA page_count").fetchone()[0]
+    freelist_count = db.execute("PRAGMA freelist_count").fetchone()[0]
+    return (page_count - freelist_count) * page_size
+
+
+def p50_p99(samples):
+    """
+    Return the median and the 99th percentile of `samples`. A single sample is
+    both; no samples give NaN.
+    """
+    if len(samples) > 1:
+        import statistics
+
+        percentiles = statistics.quantiles(samples, n=100, method="inclusive")
+        return percentiles[49], percentiles[98]
+    p = samples[0] if samples else float("nan")
+    return p, p
+
+
+def benchmark_full_text_search(db, table, queries=FTS_BENCHMARK_QUERIES, repeat=5):
+    """
+    Run each query `repeat` times with the same SQL as the find_files datasette
+    query, using the MATCH expression the index in `table` supports. Returns the
+    latencies in seconds and the queries that were rejected anyway.
+    """
+    detail, tokenizer = fts_options(db, table)
+    latencies, unsupported = [], []
+    for q in queries:
+        match = fts_match_expression(
+            q.rstrip("*"), detail, tokenizer, prefix=q.endswith("*")
+        )
+        for _ in range(repeat):
+            t0 = time.perf_counter()
+            try:
+                db.execute(
+                    f"""
+                    SELECT path
+                    FROM {table}
+                    WHERE {table} MATCH (?)
+                    ORDER BY bm25({table})
+                    LIMIT 100
+                    """,
+                    (match,),
+                ).fetchall()
+            except sqlite3.OperationalError:
+                unsupported.append(q)
+                break
+            latencies.append(time.perf_counter() - t0)
+    return latencies, unsupported
+
+
+def report_full_text_search(dbpath=DBPATH, variants=FTS_VARIANTS, repeat=5):
+    """
+    Build each FTS variant in a scratch table, measure its size on disk and the
+    p50/p99 latency on FTS_BENCHMARK_QUERIES, then drop it again.
+
+    The variants are built in a temporary copy of `dbpath`, next to it, so the
+    database itself is left untouched.
+    """
+    import tempfile
+
+    table = "PathToArtifactIds_fts_report"
+    results = []
+    with tempfile.TemporaryDirectory(
+        dir=os.path.dirname(os.path.abspath(dbpath))
+    ) as tmp:
+        scratch = os.path.join(tmp, os.path.basename(dbpath))
+        db = connect(dbpath=dbpath)
+        db.execute("VACUUM INTO (?)", (scratch,))
+        db.close()
+        db = connect(dbpath=scratch)
+        for name, options in tqdm(variants.items(), desc="Benchmarking FTS variants"):
+            before = used_bytes(db)
+            t0 = time.time()
+            index_full_text_search(db, table=table, **options)
+            build_time = time.time() - t0
+            size = used_bytes(db) - before
+            latencies, unsupported = benchmark_full_text_search(
+                db, table, repeat=repeat
+            )
+            p50, p99 = p50_p99(latencies)
+            results.append((name, size, build_time, p50, p99, unsupported))
+            db.execute(f"DROP TABLE {table}")
+            db.commit()
+        db.close()
+    return results
+
+
+def query(db, q, limit=100, fts=False, highlight=True):
     if (
         '"' in q
         or "'" in q
@@ -156,14 +383,19 @@ def query(db, q, limit=100, fts=False):
     ):
         raise ValueError("Illegal query")
     if fts:
+        match = fts_match_expression(q, *fts_options(db))
+        column = "path"
+        if highlight:
+            column = "highlight(PathToArtifactIds_fts, 0, '*', '*')"
         for row in db.execute(
             f"""
-            SELECT highlight(PathToArtifactIds_fts, 0, '*', '*')
+            SELECT {column}
             FROM PathToArtifactIds_fts
-            WHERE PathToArtifactIds_fts MATCH '"{q}"'
+            WHERE PathToArtifactIds_fts MATCH (?)
             ORDER BY bm25(PathToArtifactIds_fts)
             LIMIT {limit}
-            """
+            """,
+            (match,),
         ):
             yield row
     else:
@@ -190,13 +422,22 @@ def most_recent_artifact(db) -> tuple[str, int]:
         return row
 
 
+def operational_errors():
+    """
+    Exception types raised for missing tables and the like: sqlite3's and, if a
+    seekable database was opened, apsw's.
+    """
+    apsw = sys.modules.get("apsw")
+    return (sqlite3.OperationalError,) + ((apsw.SQLError,) if apsw else ())
+
+
 def get_latest_successful_update(db):
     try:
         for row in db.execute(
             "SELECT timestamp from LatestSuccessfulUpdate WHERE id = 0"
         ):
             return row[0]
-    except sqlite3.OperationalError as exc:
+    except operational_errors() as exc:
         log.exception(exc)
         return 0
 
@@ -228,7 +469,475 @@ def count_artifacts(db):
         return row[0]
 
 
+def has_table(db, name):
+    for _ in db.execute(
+        "SELECT name FROM sqlite_master WHERE type = 'table' AND name = (?)", (name,)
+    ):
+        return True
+    return False
+
+
+def compact_posting_lists(db, batch_size=100_000):
+    """
+    Posting lists in PathToArtifactIds are only ever appended to, so over time
+    they end up unsorted and sometimes with duplicated ids. Failed artifacts are
+    also deleted from Artifacts, but their ids stay behind in the lists.
+
+    This sorts and dedups every list, drops ids that no longer exist in Artifacts,
+    and removes paths left without any artifact. Removed packages (timestamp = 0)
+    are kept on purpose: they are part of the inventory and their files are still
+    valid matches.
+
+    Returns a tuple with the number of rewritten lists and deleted paths.
+    """
+    valid_ids = {row[0] for row in db.execute("SELECT id FROM Artifacts")}
+    has_fts = has_table(db, "PathToArtifactIds_fts")
+    rewritten = deleted = 0
+    last_rowid = -1
+    while True:
+        rows = db.execute(
+            """
+            SELECT rowid, path, artifact_ids
+            FROM PathToArtifactIds
+            WHERE rowid > (?)
+            ORDER BY rowid
+            LIMIT (?)
+            """,
+            (last_rowid, batch_size),
+        ).fetchall()
+        if not rows:
+            break
+        last_rowid = rows[-1][0]
+        to_update, to_delete = [], []
+        for rowid, path, artifact_ids in rows:
+            ids = sorted(
+                {int(id_) for id_ in (artifact_ids or "").split(",") if id_} & valid_ids
+            )
+            if not ids:
+                to_delete.append((rowid, path))
+                continue
+            compacted = ",".join(map(str, ids))
+            if compacted != artifact_ids:
+                to_update.append((compacted, rowid))
+        db.executemany(
+            "UPDATE PathToArtifactIds SET artifact_ids = (?) WHERE rowid = (?)",
+            to_update,
+        )
+        if has_fts:
+            # External content FTS tables must be told about deletions explicitly
+            db.executemany(
+                """
+                INSERT INTO PathToArtifactIds_fts(PathToArtifactIds_fts, rowid, path)
+                VALUES ('delete', ?, ?)
+                """,
+                to_delete,
+            )
+        db.executemany(
+            "DELETE FROM PathToArtifactIds WHERE rowid = (?)",
+            ((rowid,) for rowid, _ in to_delete),
+        )
+        db.commit()
+        rewritten += len(to_update)
+        deleted += len(to_delete)
+    return rewritten, deleted
+
+
+def vacuum_index(db, dbpath=DBPATH):
+    """
+    Compact the posting lists, refresh the planner statistics, merge the FTS
+    segments and rebuild the whole file with VACUUM INTO, which writes every
+    table and index back in key order with no free pages in between.
+
+    The connection is closed and the database at `dbpath` is replaced in place.
+    Returns the number of reclaimed bytes.
+    """
+    size_before = os.path.getsize(dbpath)
+    rewritten, deleted = compact_posting_lists(db)
+    print(f"Compacted {rewritten} posting lists; removed {deleted} orphan paths")
+    if has_table(db, "PathToArtifactIds_fts"):
+        db.execute(
+            "INSERT INTO PathToArtifactIds_fts(PathToArtifactIds_fts) "
+            "VALUES('optimize')"
+        )
+    db.execute("ANALYZE")
+    db.commit()
+    vacuumed = f"{dbpath}.vacuum"
+    if os.path.exists(vacuumed):
+        os.unlink(vacuumed)
+    db.execute("VACUUM INTO (?)", (vacuumed,))
+    db.close()
+    os.replace(vacuumed, dbpath)
+    return size_before - os.path.getsize(dbpath)
+
+
+# The b-trees the datasette queries read, hottest first, with a full scan of each.
+# The scans walk each b-tree in key order, which after `vacuum-index` is (mostly)
+# ascending page order. substr() is used on blobs and texts because it walks the
+# overflow chains, while length() would not.
+WARMUP_BTREES = {
+    # find_artifacts maps every matching id to its name
+    "Artifacts rows": ("Artifacts", "SELECT count(*) FROM Artifacts NOT INDEXED"),
+    "PathToArtifactIds_fts index": (
+        "PathToArtifactIds_fts_idx",
+        "SELECT count(*) FROM PathToArtifactIds_fts_idx",
+    ),
+    # bm25() reads the document size of every find_files match
+    "PathToArtifactIds_fts docsize": (
+        "PathToArtifactIds_fts_docsize",
+        "SELECT count(substr(sz, -1)) FROM PathToArtifactIds_fts_docsize",
+    ),
+    "PathToArtifactIds primary key": (
+        "sqlite_autoindex_PathToArtifactIds_1",
+        "SELECT count(*) FROM PathToArtifactIds "
+        "INDEXED BY sqlite_autoindex_PathToArtifactIds_1",
+    ),
+    "PathToArtifactIds_fts segments": (
+        "PathToArtifactIds_fts_data",
+        "SELECT count(substr(block, -1)) FROM PathToArtifactIds_fts_data",
+    ),
+    # Both queries read single rows by rowid; on the deployment VM this one does
+    # not fit next to the others and only its interior pages get warmed
+    "PathToArtifactIds rows": (
+        "PathToArtifactIds",
+        "SELECT count(substr(artifact_ids, -1)) FROM PathToArtifactIds NOT INDEXED",
+    ),
+}
+# Share of the available memory the warm-up may fill; the rest is left to the
+# server and to whatever else is cached
+WARMUP_MEMORY_FRACTION = 0.6
+# Page ranges closer than this are merged, so the overflow pages that sit between
+# the leaves referencing them are read ahead too
+WARMUP_MAX_GAP = 32
+
+
+def available_memory():
+    try:
+        with open("/proc/meminfo") as f:
+            for line in f:
+                if line.startswith("MemAvailable:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return None
+
+
+def btree_page_ranges(fd, rootpage, page_size, max_gap=WARMUP_MAX_GAP):
+    """
+    Return the merged (first, last) page number ranges of the b-tree rooted at
+    `rootpage` in the database file open as `fd`.
+
+    Only the interior pages are read: the leaves are the children of the lowest
+    interior level, and all leaves of a b-tree are at the same depth. Overflow
+    pages are not listed, but merging ranges up to `max_gap` pages apart covers
+    those stored next to their leaves.
+    """
+
+    def read_page(pgno):
+        page = os.pread(fd, page_size, (pgno - 1) * page_size)
+        # Page 1 starts with the 100 bytes database header
+        return page, 100 if pgno == 1 else 0
+
+    def children(pgno):
+        page, header = read_page(pgno)
+        n_cells = struct.unpack_from(">H", page, header + 3)[0]
+        pointers = struct.unpack_from(f">{n_cells}H", page, header + 12)
+        return [struct.unpack_from(">I", page, p)[0] for p in pointers] + [
+            struct.unpack_from(">I", page, header + 8)[0]
+        ]
+
+    # Interior pages are types 2 (index) and 5 (table)
+    depth, pgno = 0, rootpage
+    while (page := read_page(pgno))[0][page[1]] in (2, 5):
+        depth += 1
+        pgno = children(pgno)[0]
+    pages, level = set(), [rootpage]
+    for _ in range(depth):
+        pages.update(level)
+        level = [child for pgno in sorted(level) for child in children(pgno)]
+    pages.update(level)
+
+    ranges = []
+    for pgno in sorted(pages):
+        if ranges and pgno - ranges[-1][1] <= max_gap + 1:
+            ranges[-1][1] = pgno
+        else:
+            ranges.append([pgno, pgno])
+    return [tuple(r) for r in ranges]
+
+
+def warmup(db, dbpath=DBPATH, budget=None):
+    """
+    Pull the hot pages of the database into the OS page cache so that a freshly
+    (re)started server does not pay for cold reads on its first queries.
+
+    The b-trees in WARMUP_BTREES are picked hottest first while they fit in
+    `budget` bytes (by default, WARMUP_MEMORY_FRACTION of the available memory),
+    then scanned coldest first, so the hottest are read last and stay cached.
+    Before each scan, the kernel is asked to read the b-tree's page ranges ahead.
+    Mapping the page ranges reads the interior pages of every b-tree, so even the
+    skipped ones get those. Returns the elapsed seconds per scanned b-tree.
+    """
+    if budget is None:
+        memory = available_memory()
+        budget = memory * WARMUP_MEMORY_FRACTION if memory is not None else float("inf")
+    page_size = db.execute("PRAGMA page_size").fetchone()[0]
+    rootpages = dict(db.execute("SELECT name, rootpage FROM sqlite_master"))
+    selected, used = [], 0
+    fd = os.open(dbpath, os.O_RDONLY)
+    try:
+        for name, (btree, q) in WARMUP_BTREES.items():
+            if not rootpages.get(btree):
+                log.warning("Skipping warm-up of %s: no such b-tree %s", name, btree)
+                continue
+            ranges = btree_page_ranges(fd, rootpages[btree], page_size)
+            size = sum(last - first + 1 for first, last in ranges) * page_size
+            if used + size > budget:
+                log.warning(
+                    "Skipping warm-up of %s: %.1f MiB over the memory budget",
+                    name,
+                    (used + size - budget) / 1024**2,
+                )
+                continue
+            used += size
+            selected.append((name, q, ranges))
+
+        # Keep our own page cache small; we only care about the OS one
+        db.execute("PRAGMA cache_size = -2000")
+        timings = {}
+        for name, q, ranges in reversed(selected):
+            t0 = time.time()
+            if hasattr(os, "posix_fadvise"):
+                for first, last in ranges:
+                    os.posix_fadvise(
+                        fd,
+                        (first - 1) * page_size,
+                        (last - first + 1) * page_size,
+                        os.POSIX_FADV_WILLNEED,
+                    )
+            db.execute(q).fetchall()
+            timings[name] = time.time() - t0
+    finally:
+        os.close(fd)
+    return timings
+
+
+# zstd seekable format; see contrib/seekable_format/zstd_seekable_compression_format.md
+# in the zstd repository. Files written here can be read by any compliant tool.
+SEEKABLE_SKIPPABLE_MAGIC = 0x184D2A5E
+SEEKABLE_MAGIC = 0x8F92EAB1
+SEEKABLE_FOOTER_SIZE = 9
+SEEKABLE_FRAME_SIZE = 1024 * 1024  # must be a multiple of the SQLite page size
+
+
+def compress_seekable(src=DBPATH, dest=None, frame_size=SEEKABLE_FRAME_SIZE, level=19):
+    """
+    Compress `src` as a sequence of independent zstd frames of `frame_size`
+    decompressed bytes, followed by a seek table, so readers can decompress
+    only the frames they need. Returns the path of the compressed file.
+    """
+    import threading
+    from concurrent.futures import ThreadPoolExecutor
+
+    import zstandard
+
+    dest = dest or f"{src}.zst"
+    # ZstdCompressor instances are not thread safe; each worker gets its own
+    local = threading.local()
+
+    def compress(chunk):
+        if not hasattr(local, "compressor"):
+            local.compressor = zstandard.ZstdCompressor(
+                level=level, write_content_size=True
+            )
+        return local.compressor.compress(chunk)
+
+    def chunks():
+        with open(src, "rb") as f:
+            while chunk := f.read(frame_size):
+                yield chunk
+
+    n_workers = os.cpu_count() or 1
+    entries = []
+    with (
+        open(dest, "wb") as out,
+        ThreadPoolExecutor(max_workers=n_workers) as executor,
+    ):
+        # zstandard releases the GIL, so frames can be compressed in parallel;
+        # batching bounds the memory used by in-flight frames
+        for batch in tqdm(
+            batched(chunks(), 4 * n_workers),
+            total=-(-os.path.getsize(src) // (4 * n_workers * frame_size)),
+            desc="Compressing frames",
+        ):
+            for chunk, frame in zip(batch, executor.map(compress, batch)):
+                out.write(frame)
+                entries.append((len(frame), len(chunk)))
+        seek_table = b"".join(struct.pack("<II", *entry) for entry in entries)
+        seek_table += struct.pack("<IBI", len(entries), 0, SEEKABLE_MAGIC)
+        out.write(struct.pack("<II", SEEKABLE_SKIPPABLE_MAGIC, len(seek_table)))
+        out.write(seek_table)
+    return dest
+
+
+class SeekableZstdReader:
+    """
+    Random access to the decompressed contents of a seekable zstd file.
+
+    Only the frames overlapping a read are decompressed. The last `cache_frames`
+    decompressed frames are kept in an LRU cache.
+    """
+
+    def __init__(self, path, cache_frames=256):
+        import zstandard
+
+        self._fd = os.open(path, os.O_RDONLY)
+        self._decompressor = zstandard.ZstdDecompressor()
+        self._compressed_offsets, self._offsets, self._sizes = self._read_seek_table()
+        self.size = self._offsets[-1] + self._sizes[-1] if self._sizes else 0
+        self._frame = lru_cache(maxsize=cache_frames)(self._decompress_frame)
+
+    def _read_seek_table(self):
+        file_size = os.fstat(self._fd).st_size
+        footer = os.pread(
+            self._fd, SEEKABLE_FOOTER_SIZE, file_size - SEEKABLE_FOOTER_SIZE
+        )
+        n_frames, descriptor, magic = struct.unpack("<IBI", footer)
+        if magic != SEEKABLE_MAGIC:
+            raise ValueError("Not a seekable zstd file")
+        entry_size = 12 if descriptor & 0x80 else 8
+        table_size = n_frames * entry_size + SEEKABLE_FOOTER_SIZE
+        table_start = file_size - table_size - 8
+        header = os.pread(self._fd, 8, table_start)
+        if struct.unpack("<II", header) != (SEEKABLE_SKIPPABLE_MAGIC, table_size):
+            raise ValueError("Corrupted seek table")
+        table = os.pread(self._fd, n_frames * entry_size, table_start + 8)
+        compressed_offsets, offsets, sizes = [], [], []
+        compressed_offset = offset = 0
+        for i in range(n_frames):
+            compressed_size, size = struct.unpack_from("<II", table, i * entry_size)
+            compressed_offsets.append((compressed_offset, compressed_size))
+            offsets.append(offset)
+            sizes.append(size)
+            compressed_offset += compressed_size
+            offset += size
+        return compressed_offsets, offsets, sizes
+
+    def _decompress_frame(self, index):
+        offset, size = self._compressed_offsets[index]
+        return self._decompressor.decompress(os.pread(self._fd, size, offset))
+
+    def pread(self, amount, offset):
+        chunks = []
+        index = bisect_right(self._offsets, offset) - 1
+        end = min(offset + amount, self.size)
+        while offset < end:
+            frame = self._frame(index)
+            start = offset - self._offsets[index]
+            chunk = frame[start : start + end - offset]
+            chunks.append(chunk)
+            offset += len(chunk)
+            index += 1
+        return b"".join(chunks)
+
+    def close(self):
+        self._frame.cache_clear()
+        os.close(self._fd)
+
+
+@lru_cache(maxsize=None)
+def seekable_vfs():
+    """
+    Register (once) the read-only SQLite VFS for seekable zstd databases.
+    The cached return value keeps the VFS alive while it is registered.
+    """
+    import apsw
+
+    class SeekableZstdFile:
+        def __init__(self, name):
+            self.reader = SeekableZstdReader(
+                name.filename(), cache_frames=name.uri_int("cache_frames", 256)
+            )
+
+        def xRead(self, amount, offset):
+            return self.reader.pread(amount, offset)
+
+        def xFileSize(self):
+            return self.reader.size
+
+        def xClose(self):
+            self.reader.close()
+
+        def xWrite(self, data, offset):
+            raise apsw.ReadOnlyError("seekable zstd databases are read-only")
+
+        def xTruncate(self, newsize):
+            raise apsw.ReadOnlyError("seekable zstd databases are read-only")
+
+        def xSync(self, flags):
+            pass
+
+        def xLock(self, level):
+            pass
+
+        def xUnlock(self, level):
+            pass
+
+        def xCheckReservedLock(self):
+            return False
+
+        def xFileControl(self, op, ptr):
+            return False
+
+        def xSectorSize(self):
+            return 4096
+
+        def xDeviceCharacteristics(self):
+            return apsw.mapping_device_characteristics["SQLITE_IOCAP_IMMUTABLE"]
+
+    class SeekableZstdVFS(apsw.VFS):
+        def __init__(self):
+            super().__init__("seekable-zstd", base="")
+
+        def xOpen(self, name, flags):
+            if flags[0] & apsw.SQLITE_OPEN_MAIN_DB:
+                return SeekableZstdFile(name)
+            # Temporary files (sorters, temp b-trees) go to the default VFS
+            return super().xOpen(name, flags)
+
+    return SeekableZstdVFS()
+
+
+def connect_seekable(path, cache_frames=256):
+    """
+    Open a read-only connection to a database compressed with `compress_seekable`,
+    without extracting it. Requires `apsw`, since the stdlib `sqlite3` module cannot
+    register custom VFSes. The returned connection supports `query()`.
+    """
+    from urllib.parse import quote
+
+    try:
+        import apsw
+    except ImportError as exc:
+        raise ImportError(
+            "Querying seekable .zst databases needs apsw and zstandard "
+            "(see environment.yml)"
+        ) from exc
+
+    if not os.path.isfile(path):
+        raise FileNotFoundError(f"No such database: {path}")
+    seekable_vfs()
+    return apsw.Connection(
+        f"file:{quote(os.path.abspath(path))}?immutable=1&cache_frames={cache_frames}",
+        flags=apsw.SQLITE_OPEN_READONLY | apsw.SQLITE_OPEN_URI,
+        vfs="seekable-zstd",
+    )
+
+
 def fetch_and_extract_one(url, dest):
+    import bz2
+    from urllib.error import HTTPError
+    from urllib.request import urlretrieve
+
     dest = Path(dest)
     dest.parent.mkdir(parents=True, exist_ok=True)
     # Download the file
@@ -237,6 +946,7 @@ def fetch_and_extract_one(url, dest):
         try:
             download_location, _ = urlretrieve(url)
         except HTTPError:
+            attempts += 1
             time.sleep(1 * attempts)
             continue
         else:
@@ -245,6 +955,7 @@ def fetch_and_extract_one(url, dest):
                     f.write(bz2.decompress(compressed.read()))
                 Path(download_location).unlink()
             except OSError:
+                attempts += 1
                 time.sleep(1 * attempts)
                 continue
             else:
@@ -254,15 +965,19 @@ def fetch_and_extract_one(url, dest):
 
 
 def fetch_repodata(
-    subdirs=SUBDIRS,
+    subdirs=None,
     force_download=False,
     cache_dir=".repodata_cache",
     label="main",
 ):
+    from conda_forge_metadata.repodata import SUBDIRS
+
+    if subdirs is None:
+        subdirs = SUBDIRS
     assert all(subdir in SUBDIRS for subdir in subdirs)
     paths = []
     for subdir in subdirs:
-        prefix = "https://conda.anaconda.org/conda-forge"
+        prefix = CHANNEL_URL
         if label == "main":
             # We don't need patches, and this way we can get 'removed' items with timestamps
             repodata = f"{prefix}/{subdir}/repodata_from_packages.json"
@@ -276,9 +991,15 @@ def fetch_repodata(
 
 
 def new_artifacts(ts):
+    from concurrent.futures import ThreadPoolExecutor, as_completed
+    from itertools import product
+
+    from conda_forge_metadata.repodata import SUBDIRS, all_labels
+
     futures = []
     with ThreadPoolExecutor(max_workers=10) as executor:
-        for label, subdir in product(all_labels(use_remote_cache=True), SUBDIRS):
+        labels = LABELS.split(",") if LABELS else all_labels(use_remote_cache=True)
+        for label, subdir in product(labels, SUBDIRS):
             future = executor.submit(
                 fetch_repodata, (subdir,), False, ".repodata_cache", label
             )
@@ -319,13 +1040,21 @@ def new_artifacts(ts):
 
 
 def files_from_artifact(artifact):
+    from conda_forge_metadata.artifact_info import get_artifact_info_as_json
+    from conda_forge_metadata.artifact_info.info_json import (
+        info_json_from_tar_generator,
+    )
+    from conda_forge_metadata.oci import get_oci_artifact_data
+    from conda_forge_metadata.streaming import get_streamed_artifact_data
+
     time.sleep(0.05)
     channel, subdir, artifact = artifact.rsplit("/", 2)
     if "-" in channel:
         channel, label = channel.split("-", 1)
-        channel = "https://conda.anaconda.org/conda-forge/label/" + label
+        channel = f"{CHANNEL_URL}/label/{label}"
+        oci_channel = None  # labels are not mirrored to OCI
     else:
-        channel = "conda-forge"
+        channel, oci_channel = CHANNEL_URL, "conda-forge"
 
     if artifact.endswith(".conda"):
         # .conda artifacts can be streamed directly from an anaconda.org channel
@@ -345,15 +1074,14 @@ def files_from_artifact(artifact):
 
     # .tar.bz2 artifacts need to be downloaded and extracted, but the OCI mirror has
     # the info layer that we can use to get the files list
-    data = get_artifact_info_as_json(
-        channel=channel,
-        subdir=subdir,
-        artifact=artifact,
-        backend="oci",
-        skip_files_suffixes=(),
-    )
-    if data and data.get("name"):
-        return data
+    # Same as get_artifact_info_as_json(backend="oci"), which doesn't take a registry
+    if oci_channel:
+        data = info_json_from_tar_generator(
+            get_oci_artifact_data(oci_channel, subdir, artifact, registry=OCI_REGISTRY),
+            skip_files_suffixes=(),
+        )
+        if data and data.get("name"):
+            return data
 
     # Last resort, we download the tar.bz2 and hope is not too big.
     # This is mostly for .tar.bz2 artifacts in labels that are not OCI mirrored.
@@ -367,10 +1095,7 @@ def files_from_artifact(artifact):
     except OSError as exc:
         # Try with non-CDN location; note this endpoint doesn't have HTTP range requests.
         # .conda files will fail this fallback.
-        if channel == "conda-forge":
-            channel = "https://conda-web.anaconda.org/conda-forge"
-        else:
-            channel = channel.replace("conda.anaconda.org", "conda-web.anaconda.org")
+        channel = channel.replace(CHANNEL_URL, CHANNEL_WEB_URL, 1)
         data = info_json_from_tar_generator(
             get_streamed_artifact_data(channel, subdir, artifact),
             skip_files_suffixes=(),
@@ -390,6 +1115,8 @@ def update_from_repodata(db):
     due to network issues and whatnot, so we catch potential exceptions
     and delete those form the Artifacts table so they are retried eventually.
     """
+    from concurrent.futures import ThreadPoolExecutor, as_completed
+
     start_from = (
         get_latest_successful_update(db) or 1701843236881
     )  # Dec 2023 (last libcfgraph item)
@@ -501,91 +1228,328 @@ def update_from_repodata(db):
             break
 
 
-if __name__ == "__main__":
-    logging.basicConfig()
-    logging.getLogger("urllib3").setLevel(logging.ERROR)
-    if len(sys.argv) == 3:
-        action = sys.argv[1]
-        if action == "bootstrap":
-            artifacts_dir = sys.argv[2]
-            db = connect(bootstrap=True)
-            bootstrap_from_libcfgraph_path_to_artifact(db, artifacts_dir)
-            db.commit()
-            db.close()
-            sys.exit()
+# Read-only subcommands meant to be called from scripts; their errors are reported
+# without a traceback (as JSON with --json)
+QUERY_COMMANDS = (
+    "find-artifacts",
+    "find-paths",
+    "most-recent-artifact",
+    "most-recent-successful-update",
+)
+STARTUP_BENCHMARK_COMMANDS = {
+    "find-artifacts": ["find-artifacts", "bin/python"],
+    "find-paths": ["find-paths", "python"],
+    "most-recent-artifact": ["most-recent-artifact"],
+}
+
+
+def benchmark_startup(dbpath=DBPATH, runs=20):
+    """
+    Time full invocations of the query subcommands in fresh interpreters, as
+    scripts calling this CLI would. Also returns the slowest imports of one
+    find-artifacts run as reported by `python -X importtime`.
+    """
+    import subprocess
+
+    results = {}
+    for name, command in STARTUP_BENCHMARK_COMMANDS.items():
+        argv = [sys.executable, __file__, *command, "--db", dbpath, "--json"]
+        timings = []
+        for _ in range(runs):
+            t0 = time.perf_counter()
+            subprocess.run(argv, check=True, capture_output=True)
+            timings.append(time.perf_counter() - t0)
+        p50, p99 = p50_p99(timings)
+        results[name] = {"p50": p50, "p99": p99}
+
+    process = subprocess.run(
+        [sys.executable, "-X", "importtime", __file__]
+        + STARTUP_BENCHMARK_COMMANDS["find-artifacts"]
+        + ["--db", dbpath, "--json"],
+        check=True,
+        capture_output=True,
+        text=True,
+    )
+    imports = []
+    for line in process.stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, cumulative, module = line.split("|")
+        if cumulative.strip().isdigit():
+            imports.append((int(cumulative) / 1e6, module.strip()))
+    return results, sorted(imports, reverse=True)[:10]
+
+
+def format_timestamp(ts):
+    return datetime.fromtimestamp(ts / 1000, UTC).strftime("%Y-%m-%d %H:%M:%S %Z")
+
+
+def connect_any(dbpath):
+    if dbpath.endswith(".zst"):
+        return connect_seekable(dbpath)
+    return connect_readonly(dbpath)
 
-        if action in ("find-artifacts", "find-paths"):
-            db = connect()
-            t0 = time.time()
-            for i, row in enumerate(query(db, sys.argv[2], fts=action == "find-paths")):
-                print(f"{i}) {row[0]}")
-            print(f"Query took {time.time() - t0:.4f} seconds")
-            db.close()
-            sys.exit()
-
-    if len(sys.argv) == 2:
-        if sys.argv[1] == "fts":
-            db = connect()
-            t0 = time.time()
-            index_full_text_search(db)
-            print(f"FTS indexing took {time.time() - t0:.4f} seconds")
-            db.close()
-            sys.exit()
-
-        if sys.argv[1] == "most-recent-artifact":
-            db = connect()
-            name, ts = most_recent_artifact(db)
-            print(
-                name,
-                ts / 1000,
-                datetime.fromtimestamp(ts / 1000, UTC).strftime("%Y-%m-%d %H:%M:%S %Z"),
-            )
-            db.close()
-            sys.exit()
-
-        if sys.argv[1] == "most-recent-successful-update":
-            db = connect()
-            ts = get_latest_successful_update(db)
-            print(
-                ts / 1000,
-                datetime.fromtimestamp(ts / 1000, UTC).strftime("%Y-%m-%d %H:%M:%S %Z"),
-            )
-            db.close()
-            sys.exit()
-
-        if sys.argv[1] == "update-from-repodata":
-            db = connect()
-            print("Artifacts before update:", count_artifacts(db))
-            update_from_repodata(db)
-            print("Artifacts after update:", count_artifacts(db))
-            name, ts = most_recent_artifact(db)
-            print(
-                "Most recent one:",
-                name,
-                ts / 1000,
-                datetime.fromtimestamp(ts / 1000, UTC).strftime("%Y-%m-%d %H:%M:%S %Z"),
-            )
-            failed = Path("failed_artifacts.txt")
-            if failed.is_file():
-                log.warning("Couldn't fetch these artifacts, please retry:")
-                with open(failed) as f:
-                    for i, line in enumerate(f, 1):
-                        log.warning("%s. %s", i, line)
-            else:
-                # Update epoch timestamp because no errors happened :D
-                set_latest_successful_update(db)
-            db.close()
-            sys.exit()
 
+def cli_bootstrap(args):
+    db = connect(bootstrap=True, dbpath=args.db)
+    bootstrap_from_libcfgraph_path_to_artifact(db, args.artifacts_dir)
+    db.commit()
+    db.close()
+
+
+def cli_fts(args):
+    db = connect(dbpath=args.db)
+    t0 = time.time()
+    index_full_text_search(
+        db,
+        detail=args.detail,
+        columnsize=args.columnsize,
+        prefix=args.prefix,
+        tokenizer=args.tokenizer,
+    )
+    print(f"FTS indexing took {time.time() - t0:.4f} seconds")
+    db.close()
+
+
+def cli_fts_report(args):
     print(
-        f"Usage: {sys.argv[0]} subcommand",
-        "subcommands:",
-        "  - bootstrap /path/to/libcfgraph/artifacts/  # initialize the database",
-        "  - fts                                       # index the full text search",
-        "  - find-artifacts <full path>                # find artifacts by full path",
-        "  - find-paths <path component>               # find full paths by partial matches",
-        "  - update-from-repodata                      # update the database from current repodata",
-        "  - most-recent-artifact                      # print latest artifact in database",
-        sep="\n",
+        f"{'variant':<24} {'size (MiB)':>10} {'build (s)':>10} "
+        f"{'p50 (ms)':>9} {'p99 (ms)':>9}  unsupported"
+    )
+    results = report_full_text_search(args.db)
+    for name, size, build_time, p50, p99, unsupported in results:
+        print(
+            f"{name:<24} {size / 1024**2:>10.1f} {build_time:>10.1f} "
+            f"{p50 * 1000:>9.2f} {p99 * 1000:>9.2f}  {len(unsupported)}"
+        )
+
+
+def cli_find(args):
+    db = connect_any(args.db)
+    t0 = time.time()
+    rows = [
+        row[0]
+        for row in query(
+            db,
+            args.query,
+            limit=args.limit,
+            fts=args.command == "find-paths",
+            highlight=not args.json,
+        )
+    ]
+    elapsed = time.time() - t0
+    db.close()
+    if args.json:
+        print(json.dumps({"query": args.query, "results": rows, "seconds": elapsed}))
+        return
+    for i, row in enumerate(rows):
+        print(f"{i}) {row}")
+    print(f"Query took {elapsed:.4f} seconds")
+
+
+def cli_most_recent_artifact(args):
+    db = connect_any(args.db)
+    name, ts = most_recent_artifact(db)
+    db.close()
+    if args.json:
+        print(json.dumps({"artifact": name, "timestamp": ts}))
+        return
+    print(name, ts / 1000, format_timestamp(ts))
+
+
+def cli_most_recent_successful_update(args):
+    db = connect_any(args.db)
+    ts = get_latest_successful_update(db)
+    db.close()
+    if args.json:
+        print(json.dumps({"timestamp": ts}))
+        return
+    print(ts / 1000, format_timestamp(ts))
+
+
+def cli_update_from_repodata(args):
+    db = connect(dbpath=args.db)
+    print("Artifacts before update:", count_artifacts(db))
+    update_from_repodata(db)
+    print("Artifacts after update:", count_artifacts(db))
+    name, ts = most_recent_artifact(db)
+    print("Most recent one:", name, ts / 1000, format_timestamp(ts))
+    failed = Path("failed_artifacts.txt")
+    if failed.is_file():
+        log.warning("Couldn't fetch these artifacts, please retry:")
+        with open(failed) as f:
+            for i, line in enumerate(f, 1):
+                log.warning("%s. %s", i, line)
+    else:
+        # Update epoch timestamp because no errors happened :D
+        set_latest_successful_update(db)
+    db.close()
+
+
+def cli_vacuum_index(args):
+    db = connect(dbpath=args.db)
+    t0 = time.time()
+    reclaimed = vacuum_index(db, args.db)
+    print(f"Reclaimed {reclaimed} bytes ({reclaimed / 1024**2:.1f} MiB)")
+    print(f"Vacuum took {time.time() - t0:.4f} seconds")
+
+
+def cli_warmup(args):
+    db = connect_readonly(args.db)
+    t0 = time.time()
+    for name, elapsed in warmup(db, args.db).items():
+        print(f"Warmed up {name} in {elapsed:.4f} seconds")
+    print(f"Warm-up took {time.time() - t0:.4f} seconds")
+    db.close()
+
+
+def cli_compress_seekable(args):
+    t0 = time.time()
+    dest = compress_seekable(args.db, args.output)
+    print(
+        f"Compressed {os.path.getsize(args.db)} bytes into {os.path.getsize(dest)} "
+        f"bytes ({dest}) in {time.time() - t0:.4f} seconds"
+    )
+
+
+def cli_benchmark_startup(args):
+    results, imports = benchmark_startup(args.db, runs=args.runs)
+    if args.json:
+        print(json.dumps({"commands": results, "slowest_imports": imports}))
+        return
+    print(f"{'command':<24} {'p50 (ms)':>9} {'p99 (ms)':>9}")
+    for name, timings in results.items():
+        print(f"{name:<24} {timings['p50'] * 1000:>9.2f} {timings['p99'] * 1000:>9.2f}")
+    print("Slowest imports (cumulative, find-artifacts):")
+    for seconds, module in imports:
+        print(f"  {seconds * 1000:>8.2f} ms  {module}")
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(
+        description="Find which conda-forge artifacts provide a given file path."
     )
-    sys.exit(1)
+    subparsers = parser.add_subparsers(
+        dest="command", required=True, metavar="subcommand"
+    )
+
+    def add_db_argument(subparser, compressed=False):
+        subparser.add_argument(
+            "--db",
+            default=DBPATH,
+            help="path to the database"
+            + (" (.zst files are queried in place)" if compressed else ""),
+        )
+
+    sub = subparsers.add_parser("bootstrap", help="initialize the database")
+    sub.add_argument("artifacts_dir", help="path to libcfgraph's artifacts/ directory")
+    add_db_argument(sub)
+    sub.set_defaults(func=cli_bootstrap)
+
+    sub = subparsers.add_parser("fts", help="index the full text search")
+    sub.add_argument("--detail", choices=("full", "column", "none"), default="full")
+    sub.add_argument("--no-columnsize", dest="columnsize", action="store_false")
+    sub.add_argument(
+        "--prefix",
+        type=lambda value: tuple(int(n) for n in value.split(",") if n),
+        default=(),
+        help="comma-separated prefix lengths to index, e.g. 2,3",
+    )
+    sub.add_argument("--tokenizer", choices=tuple(FTS_TOKENIZERS), default="unicode61")
+    add_db_argument(sub)
+    sub.set_defaults(func=cli_fts)
+
+    sub = subparsers.add_parser(
+        "fts-report", help="compare FTS variants by size and latency"
+    )
+    add_db_argument(sub)
+    sub.set_defaults(func=cli_fts_report)
+
+    for name, help_, query_help in (
+        ("find-artifacts", "find artifacts by full path", "full path"),
+        ("find-paths", "find full paths by partial matches", "path component"),
+    ):
+        sub = subparsers.add_parser(name, help=help_)
+        sub.add_argument("query", help=query_help)
+        add_db_argument(sub, compressed=True)
+        sub.add_argument("--limit", type=int, default=100)
+        sub.add_argument("--json", action="store_true", help="print results as JSON")
+        sub.set_defaults(func=cli_find)
+
+    sub = subparsers.add_parser(
+        "most-recent-artifact", help="print latest artifact in database"
+    )
+    add_db_argument(sub, compressed=True)
+    sub.add_argument("--json", action="store_true", help="print results as JSON")
+    sub.set_defaults(func=cli_most_recent_artifact)
+
+    sub = subparsers.add_parser(
+        "most-recent-successful-update", help="print latest successful update timestamp"
+    )
+    add_db_argument(sub, compressed=True)
+    sub.add_argument("--json", action="store_true", help="print results as JSON")
+    sub.set_defaults(func=cli_most_recent_successful_update)
+
+    sub = subparsers.add_parser(
+        "update-from-repodata", help="update the database from current repodata"
+    )
+    add_db_argument(sub)
+    sub.set_defaults(func=cli_update_from_repodata)
+
+    sub = subparsers.add_parser(
+        "vacuum-index", help="compact posting lists and vacuum the file"
+    )
+    add_db_argument(sub)
+    sub.set_defaults(func=cli_vacuum_index)
+
+    sub = subparsers.add_parser(
+        "warmup", help="prefetch the hot indexes into the page cache"
+    )
+    add_db_argument(sub)
+    sub.set_defaults(func=cli_warmup)
+
+    sub = subparsers.add_parser(
+        "compress-seekable", help="compress the database as seekable zstd"
+    )
+    add_db_argument(sub)
+    sub.add_argument(
+        "-o", "--output", help="path to the compressed file (default: <db>.zst)"
+    )
+    sub.set_defaults(func=cli_compress_seekable)
+
+    sub = subparsers.add_parser(
+        "benchmark-startup", help="time query subcommands in fresh interpreters"
+    )
+    add_db_argument(sub, compressed=True)
+    sub.add_argument("--runs", type=int, default=20)
+    sub.add_argument("--json", action="store_true", help="print results as JSON")
+    sub.set_defaults(func=cli_benchmark_startup)
+
+    return parser
+
+
+def main(argv=None):
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    logging.basicConfig()
+    logging.getLogger("urllib3").setLevel(logging.ERROR)
+    if args.command not in QUERY_COMMANDS:
+        args.func(args)
+        return
+    try:
+        args.func(args)
+    except (
+        OSError,
+        ImportError,
+        ValueError,
+        sqlite3.Error,
+        *operational_errors(),
+    ) as exc:
+        if args.json:
+            print(json.dumps({"error": str(exc)}))
+            sys.exit(1)
+        parser.exit(1, f"{parser.prog} {args.command}: error: {exc}\n")
+
+
+if __name__ == "__main__":
+    main()
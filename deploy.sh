@@ -6,25 +6,38 @@ conda activate datasette
 set -euxo pipefail
 
 if [[ $1 == "update" ]]; then
-    curl -sfL -o path_to_artifacts.tar.zst \
-        https://github.com/Quansight-Labs/conda-forge-paths/releases/latest/download/path_to_artifacts.tar.zst
+    # Stage, verify and warm up the new database next to the current one, which
+    # keeps being served. The final mv is atomic; the running server holds on to
+    # the old file until it is restarted.
     curl -sfL -o path_to_artifacts.db.sha256 \
         https://github.com/Quansight-Labs/conda-forge-paths/releases/latest/download/path_to_artifacts.db.sha256
-    mkdir -p extracted
-    tar xf path_to_artifacts.tar.zst -C extracted
-    rm path_to_artifacts.tar.zst
+    if [[ -f path_to_artifacts.db && -f path_to_artifacts.db.sha256.deployed ]] \
+        && cmp -s path_to_artifacts.db.sha256 path_to_artifacts.db.sha256.deployed; then
+        echo "Database is already up to date"
+    else
+        curl -sfL -o path_to_artifacts.tar.zst \
+            https://github.com/Quansight-Labs/conda-forge-paths/releases/latest/download/path_to_artifacts.tar.zst
+        mkdir -p extracted
+        tar xf path_to_artifacts.tar.zst -C extracted
+        rm path_to_artifacts.tar.zst
 
-    if [[ "$(openssl sha256 extracted/path_to_artifacts.db | cut -d ' ' -f2)" != "$(cat path_to_artifacts.db.sha256  | cut -d ' ' -f2)" ]]; then
-        echo "SHA256 mismatch! Won't update redeploy"
-        exit 1
+        if [[ "$(openssl sha256 extracted/path_to_artifacts.db | cut -d ' ' -f2)" != "$(cat path_to_artifacts.db.sha256  | cut -d ' ' -f2)" ]]; then
+            echo "SHA256 mismatch! Won't update redeploy"
+            exit 1
+        fi
+        python conda_forge_paths/path_to_artifacts_db.py warmup --db extracted/path_to_artifacts.db
+        mv -f extracted/path_to_artifacts.db path_to_artifacts.db
+        cp path_to_artifacts.db.sha256 path_to_artifacts.db.sha256.deployed
     fi
-    mv extracted/path_to_artifacts.db path_to_artifacts.db
 
     curl -sfL -o datasette.update.yml \
         https://raw.githubusercontent.com/Quansight-Labs/conda-forge-paths/main/datasette.yml \
         && mv datasette.update.yml datasette.yml \
         || true
 elif [[ $1 == "run" ]]; then
+    # Warm up in the background so the server starts right away (e.g. after a
+    # reboot); cheap if the pages are still cached from the update step
+    nice python conda_forge_paths/path_to_artifacts_db.py warmup --db path_to_artifacts.db &
     export DATASETTE_SECRET=$(python -c 'import secrets; print(secrets.token_hex(32))')
     datasette serve \
         -i "path_to_artifacts.db" \